@@ -509,7 +509,7 @@ def main(model="efficientnet_custom_02_scales.efficientnet('efficientnet-b0')",
 
     device, gpus = set_device()
     model = obj_factory(model).to(device)
-    x = torch.rand(4, 3, res, res).to(device)
+    x = torch.empty(4, 3, res, res, device=device).uniform_()
     pred = model(x)
     print(pred.__class__)
 
@@ -435,7 +435,7 @@ def main(model='models.hyperseg_v0_1.hyperseg_efficientnet', res=(512,), pyramid
 
     device, gpus = set_device()
     model = obj_factory(model).to(device).train(train)
-    x = torch.rand(2, 3, *res).to(device)
+    x = torch.empty(2, 3, *res, device=device).uniform_()
     x = create_pyramid(x, pyramids) if pyramids is not None else x
     pred = model(x)
     print(pred.shape)
@@ -842,7 +842,7 @@ def main(model='models.hyperseg_v1_0.hypergen_efficientnet', res=(512,),
     torch.backends.cudnn.benchmark = True
     device, gpus = set_device()
     model = obj_factory(model).to(device).train(train)
-    x = torch.rand(1, 3, *res).to(device)
+    x = torch.empty(1, 3, *res, device=device).uniform_()
     x = create_pyramid(x, pyramids) if pyramids is not None else x
     pred = model(x)
     print(pred.shape)
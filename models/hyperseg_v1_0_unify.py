@@ -1,6 +1,6 @@
 import numbers
-import numpy as np
 from itertools import groupby
+from typing import List, Optional, Tuple
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -9,6 +9,10 @@ from models.layers.meta_conv import MetaConv2d
 from models.layers.meta_sequential import MetaSequential
 
 
+def _backbone_to_channels_last(module, incompatible_keys):
+    module.backbone.to(memory_format=torch.channels_last)
+
+
 class HyperGen(nn.Module):
     """ Hypernetwork generator comprised of a backbone network, weight mapper, and a decoder.
 
@@ -30,34 +34,74 @@ class HyperGen(nn.Module):
         decoder_dropout (float): If specified, enables dropout with the given probability.
         coords_res (list of tuple of int, optional): list of inference resolutions for caching positional embedding.
         unify_level (int, optional): the starting level to unify the signal to weights operation from.
+        channels_last (bool): If True, the backbone weights and input are kept in channels last memory format.
+        weight_mapper_dtype (torch.dtype, optional): If specified, the weight mapper is run in this precision (e.g.
+            torch.bfloat16) during inference.
+        static_buffers (bool): If True, the decoder level inputs are written to persistent buffers during inference.
+            Intended for repeated forwards of a fixed input shape, the model must not be run concurrently.
     """
     def __init__(self, backbone, weight_mapper, in_nc=3, num_classes=3, kernel_sizes=3, level_layers=1,
                  level_channels=None, expand_ratio=1, groups=1, weight_groups=1, inference_hflip=False,
                  inference_gather='mean', with_out_fc=False, decoder_groups=1, decoder_dropout=None, coords_res=None,
-                 unify_level=None):
+                 unify_level=None, channels_last=False, weight_mapper_dtype=None, static_buffers=False):
         super(HyperGen, self).__init__()
         self.inference_hflip = inference_hflip
         self.inference_gather = inference_gather
+        self.channels_last = channels_last
+        self.weight_mapper_dtype = weight_mapper_dtype
+        self._pinned_bufs = {}
 
         self.backbone = backbone()
+        if channels_last:
+            self.backbone.to(memory_format=torch.channels_last)
+
+            # Loading a state dict with assign=True replaces the backbone tensors with the (NCHW) checkpoint tensors
+            self.register_load_state_dict_post_hook(_backbone_to_channels_last)
         feat_channels = [in_nc] + self.backbone.feat_channels[:-1]
         self.decoder = MultiScaleDecoder(feat_channels, self.backbone.feat_channels[-1], num_classes, kernel_sizes,
                                          level_layers, level_channels, with_out_fc=with_out_fc, out_kernel_size=1,
                                          expand_ratio=expand_ratio, groups=decoder_groups, weight_groups=weight_groups,
-                                         dropout=decoder_dropout, coords_res=coords_res, unify_level=unify_level)
+                                         dropout=decoder_dropout, coords_res=coords_res, unify_level=unify_level,
+                                         static_buffers=static_buffers)
         self.weight_mapper = weight_mapper(self.backbone.feat_channels[-1], self.decoder.param_groups)
 
     @property
     def hyper_params(self):
         return self.decoder.hyper_params
 
-    def process_single_tensor(self, x, hflip=False):
-        x = torch.flip(x, [-1]) if hflip else x
-        features = self.backbone(x)
-        weights = self.weight_mapper(features[-1])
+    def process_single_tensor(self, x):
+        features = self.backbone(x.contiguous(memory_format=torch.channels_last) if self.channels_last else x)
+        if self.weight_mapper_dtype is not None and not self.training:
+            with torch.autocast(features[-1].device.type, dtype=self.weight_mapper_dtype):
+                weights = self.weight_mapper(features[-1])
+            weights = weights.to(features[-1].dtype)  # The signal to weights layers run in the decoder's precision
+        else:
+            weights = self.weight_mapper(features[-1])
         x = [x] + features[:-1]
         x = self.decoder(x, weights)
-        x = torch.flip(x, [-1]) if hflip else x
+
+        return x
+
+    def upload_tensor(self, x):
+        """ Asynchronously uploads a CPU tensor to the model's CUDA device through a persistent pinned memory buffer.
+        """
+        device = next(self.parameters()).device
+        if device.type != 'cuda' or x.device.type != 'cpu':
+            return x
+
+        key = (x.shape, x.dtype)
+        buf, event = self._pinned_bufs.get(key, (None, None))
+        if buf is None:
+            # Allocate the buffer outside inference mode, so it can also be written by training mode forwards
+            with torch.inference_mode(False):
+                buf = torch.empty(x.shape, dtype=x.dtype, pin_memory=True)
+        else:
+            event.synchronize()  # Make sure the previous upload from the buffer has completed before overwriting it
+        buf.copy_(x)
+        x = buf.to(device, non_blocking=True)
+        event = torch.cuda.Event()
+        event.record()
+        self._pinned_bufs[key] = (buf, event)
 
         return x
 
@@ -71,19 +115,59 @@ class HyperGen(nn.Module):
             return torch.max(x, y)
 
     def forward(self, x):
+        # Dynamo can't trace parameters and buffers into an inference mode region, so compiled models leave inference
+        # mode to the caller
+        if self.training or torch.compiler.is_compiling():
+            return self.process_input(x)
+
+        # In evaluation mode skip the autograd bookkeeping (version counters and view tracking) entirely
+        with torch.inference_mode():
+            return self.process_input(x)
+
+    def process_input(self, x):
         assert isinstance(x, (list, tuple, torch.Tensor)), f'x must be of type list, tuple, or tensor'
         if isinstance(x, torch.Tensor):
-            return self.process_single_tensor(x)
+            return self.process_single_tensor(self.upload_tensor(x))
+
+        # Issue the uploads of all the pyramid images upfront so they overlap with the computation
+        x = [self.upload_tensor(p) for p in x]
+
+        # In training mode each image and its horizontal flip are processed separately, so the normalization layers
+        # see the same batches (and update their running statistics as often) as the images were given
+        preds = [None] * len(x)
+        if self.training:
+            for i, p in enumerate(x):
+                pred = self.process_single_tensor(p)
+                if self.inference_hflip:
+                    pred = torch.max(pred, self.process_single_tensor(p.flip(-1)).flip(-1))
+                preds[i] = pred
+        else:
+            # In evaluation mode group the pyramid images by resolution
+            res_groups = {}
+            for i, p in enumerate(x):
+                res_groups.setdefault(p.shape[2:], []).append(i)
+
+            # Process each group, together with its horizontally flipped images, in a single batch
+            for indices in res_groups.values():
+                xb = x[indices[0]] if len(indices) == 1 else torch.cat([x[i] for i in indices], dim=0)
+                batch_size = xb.shape[0]
+                if self.inference_hflip:
+                    # Write the images and their horizontal flips directly into a single batch tensor
+                    hflip_indices = torch.arange(xb.shape[-1] - 1, -1, -1, device=xb.device)
+                    xb_hflip = xb.new_empty((2 * batch_size,) + xb.shape[1:])
+                    xb_hflip[:batch_size] = xb
+                    torch.index_select(xb, -1, hflip_indices, out=xb_hflip[batch_size:])
+                    xb = xb_hflip
+                pred = self.process_single_tensor(xb)
+                if self.inference_hflip:
+                    pred = torch.max(pred[:batch_size], pred[batch_size:].flip(-1))
+                for i, p in zip(indices, pred.split([x[i].shape[0] for i in indices], dim=0)):
+                    preds[i] = p
 
         # Note: the first pyramid will determine the output resolution
         out_res = x[0].shape[2:]
         out = None
-        for p in x:
-            if self.inference_hflip:
-                p = torch.max(self.process_single_tensor(p), self.process_single_tensor(p, hflip=True))
-            else:
-                p = self.process_single_tensor(p)
-
+        for p in preds:
             # Resize current image to output resolution if necessary
             if p.shape[2:] != out_res:
                 p = F.interpolate(p, out_res, mode='bilinear', align_corners=False)
@@ -113,11 +197,12 @@ class MultiScaleDecoder(nn.Module):
         dropout (float): If specified, enables dropout with the given probability.
         coords_res (list of tuple of int, optional): list of inference resolutions for caching positional embedding.
         unify_level (int, optional): the starting level to unify the signal to weights operation from.
+        static_buffers (bool): If True, the level inputs are written to persistent buffers during inference.
     """
     def __init__(self, feat_channels, signal_channels, num_classes=3, kernel_sizes=3, level_layers=1,
                  level_channels=None, norm_layer=nn.BatchNorm2d, act_layer=nn.ReLU6(inplace=True), out_kernel_size=1,
                  expand_ratio=1, groups=1, weight_groups=1, with_out_fc=False, dropout=None,
-                 coords_res=None, unify_level=None):  # must be a list of tuples
+                 coords_res=None, unify_level=None, static_buffers=False):  # must be a list of tuples
         super(MultiScaleDecoder, self).__init__()
         if isinstance(kernel_sizes, numbers.Number):
             kernel_sizes = (kernel_sizes,) * len(level_channels)
@@ -138,7 +223,9 @@ class MultiScaleDecoder(nn.Module):
         self.unify_level = unify_level
         self.layer_params = []
         feat_channels = feat_channels[::-1]  # Reverse the order of the feature channels
-        self.coords_cache = {}
+        self.static_buffers = static_buffers
+        self.coords_cache = {}  # Per level: (key, coordinates)
+        self._io_scratch = {}  # Per level: (key, buffer)
         self.weight_groups = weight_groups
         self.level_blocks = nn.ModuleList()
         self.weight_blocks = nn.ModuleList()
@@ -177,6 +264,19 @@ class MultiScaleDecoder(nn.Module):
                     hyper_params = sum([b.hyper_params for b in self.level_blocks[unify_level - 1:]])
                     self.weight_blocks.append(WeightLayer(hyper_params))
 
+        # Per level forward plan: (feature index, upsample, weight block index, compute weights, weight range).
+        # The input feature maps are of strictly decreasing resolutions, so every level after the first one upsamples
+        # the previous output, and the final prediction is upsampled only if there are fewer levels than feature maps
+        self._plan = []
+        for level in range(self.levels):
+            if level < (unify_level - 1):
+                self._plan.append((-level - 1, level > 0, level, True, None))
+            else:
+                i = level - unify_level + 1
+                self._plan.append((-level - 1, level > 0, unify_level - 1, level == (unify_level - 1),
+                                   (self._ranges[i], self._ranges[i + 1])))
+        self._upsample_output = self.levels < len(feat_channels)
+
         # Add the last layer
         if with_out_fc:
             out_fc_layers = [nn.Dropout2d(dropout, True)] if dropout is not None else []
@@ -194,11 +294,15 @@ class MultiScaleDecoder(nn.Module):
                     self.register_buffer(f'coord{level_res[0]}_{level_res[1]}',
                                          self.cache_image_coordinates(*level_res))
 
-        # Initialize signal to weights
-        self.param_groups = get_hyper_params(self)
+        # Initialize signal to weights (all weight layers are registered in weight_blocks in level order)
+        self.param_groups = [weight_block.target_params for weight_block in self.weight_blocks]
         min_unit = max(weight_groups)
         signal_features = divide_feature(signal_channels, self.param_groups, min_unit=min_unit)
-        init_signal2weights(self, list(signal_features), weight_groups=weight_groups)
+        signal_index = 0
+        for i, weight_block in enumerate(self.weight_blocks):
+            weight_group = weight_groups[i] if isinstance(weight_groups, (list, tuple)) else weight_groups
+            weight_block.init_signal2weights(signal_features[i], signal_index, weight_group)
+            signal_index += signal_features[i]
         self.hyper_params = sum(self.param_groups)
 
     def cache_image_coordinates(self, h, w):
@@ -208,82 +312,89 @@ class MultiScaleDecoder(nn.Module):
 
         return grid
 
-    def get_image_coordinates(self, b, h, w, device):
+    def get_image_coordinates(self, b, h, w, device, level=0):
         cache = f'coord{h}_{w}'
         if hasattr(self, cache):
             return getattr(self, cache).expand(b, -1, -1, -1)
 
-        x = torch.linspace(-1, 1, steps=w, device=device)
-        y = torch.linspace(-1, 1, steps=h, device=device)
-        grid = torch.stack(torch.meshgrid(y, x)[::-1], dim=0).unsqueeze(0)
-
-        return grid.expand(b, -1, -1, -1)
+        # Resolutions that were not cached in advance are memoized, only the most recent resolution is kept per level
+        # so inputs of varying sizes don't accumulate memory. The coordinates are created outside inference mode, so
+        # the memoized tensors remain usable by training and compiled forwards
+        key = (h, w, device)
+        cached_key, coords = self.coords_cache.get(level, (None, None))
+        if cached_key != key:
+            with torch.inference_mode(False):
+                x = torch.linspace(-1, 1, steps=w, device=device)
+                y = torch.linspace(-1, 1, steps=h, device=device)
+                coords = torch.stack(torch.meshgrid(y, x)[::-1], dim=0).unsqueeze(0)
+            self.coords_cache[level] = (key, coords)
+
+        return coords.expand(b, -1, -1, -1)
+
+    def cat_image_coordinates(self, tensors, level=0):
+        """ Concatenates the image coordinates and the given tensors along the channel dimension.
+
+        With static_buffers enabled, the tensors are written directly to their channel range of a persistent per level
+        buffer, in a single pass over each tensor.
+        """
+        b, _, h, w = tensors[0].shape
+        c = sum(t.shape[1] for t in tensors)
+        device, dtype = tensors[0].device, tensors[0].dtype
+        coords = self.get_image_coordinates(b, h, w, device, level)
+
+        # Under torch.compile the concatenation is fused with the producers of the tensors (e.g. the upsampling of the
+        # previous level output) into a single kernel, while writing to a persistent buffer would prevent the fusion
+        # and CUDA graphs. is_compiling() must be checked first, Dynamo can't trace is_inference_mode_enabled()
+        if not self.static_buffers or torch.compiler.is_compiling() or not torch.is_inference_mode_enabled():
+            return torch.cat([coords] + list(tensors), dim=1)
+
+        # In inference mode the coordinates are written once to a persistent buffer and only the tensors are copied.
+        # Only the buffer of the most recent input shape is kept per level
+        key = (b, c, h, w, device, dtype)
+        cached_key, buf = self._io_scratch.get(level, (None, None))
+        if cached_key != key:
+            buf = tensors[0].new_empty(b, c + 2, h, w)
+            buf[:, :2] = coords
+            self._io_scratch[level] = (key, buf)
+        offset = 2
+        for t in tensors:
+            buf[:, offset:offset + t.shape[1]].copy_(t)
+            offset += t.shape[1]
+
+        return buf
 
     def forward(self, x, s):
         # For each level
-        p = None
-        for level in range(self.levels):
-            level_block = self.level_blocks[level]
-            weight_block = self.weight_blocks[min(level, self.unify_level - 1)]
+        p = w = None
+        for level, (level_block, (feat_index, upsample, weight_index, compute_weights, weight_range)) in \
+                enumerate(zip(self.level_blocks, self._plan)):
+            feat = x[feat_index]
 
-            # Initial layer input
+            # Initial layer input: image coordinates, current features, and previous level output
             if p is None:
-                p = x[-level - 1]
+                p = self.cat_image_coordinates([feat], level)
             else:
                 # p = F.interpolate(p, scale_factor=2, mode='bilinear', align_corners=False)  # Upsample x2
-                if p.shape[2:] != x[-level - 1].shape[2:]:
-                    p = F.interpolate(p, x[-level - 1].shape[2:], mode='bilinear', align_corners=False)  # Upsample
-                p = torch.cat((x[-level - 1], p), dim=1)
-
-            # Add image coordinates
-            p = torch.cat([self.get_image_coordinates(p.shape[0], *p.shape[-2:], p.device), p], dim=1)
+                if upsample:
+                    p = F.interpolate(p, feat.shape[2:], mode='bilinear', align_corners=False)  # Upsample
+                p = self.cat_image_coordinates([feat, p], level)
 
-            # Computer the output for the current level
-            if level < (self.unify_level - 1):
-                w = weight_block(s)
-                p = level_block(p, w)
-            else:
-                if level == (self.unify_level - 1):
-                    w = weight_block(s)
-                i = level - self.unify_level + 1
-                p = level_block(p, w[:, self._ranges[i]:self._ranges[i + 1]])
+            # Computer the output for the current level (unified levels share the weights of a single weight block)
+            if compute_weights:
+                w = self.weight_blocks[weight_index](s)
+            p = level_block(p, w if weight_range is None else w[:, weight_range[0]:weight_range[1]])
 
         # Last layer
         if self.out_fc is not None:
             p = self.out_fc(p, s)
 
         # Upscale the prediction the finest feature map resolution
-        if p.shape[2:] != x[0].shape[2:]:
+        if self._upsample_output:
             p = F.interpolate(p, x[0].shape[2:], mode='bilinear', align_corners=False)  # Upsample
 
         return p
 
 
-def get_hyper_params(model):
-    hyper_params = []
-
-    # For each child module
-    for name, m in model.named_children():
-        if isinstance(m, (WeightLayer,)):
-            hyper_params.append(m.target_params)
-        else:
-            hyper_params += get_hyper_params(m)
-
-    return hyper_params
-
-
-def init_signal2weights(model, signal_features, signal_index=0, weight_groups=1):
-    # For each child module
-    for name, m in model.named_children():
-        if isinstance(m, (WeightLayer,)):
-            curr_feature_nc = signal_features.pop(0)
-            curr_weight_group = weight_groups.pop(0) if isinstance(weight_groups, list) else weight_groups
-            m.init_signal2weights(curr_feature_nc, signal_index, curr_weight_group)
-            signal_index += curr_feature_nc
-        else:
-            init_signal2weights(m, signal_features, signal_index, weight_groups)
-
-
 class WeightLayer(nn.Module):
     def __init__(self, target_params):
         super(WeightLayer, self).__init__()
@@ -301,15 +412,42 @@ class WeightLayer(nn.Module):
     def apply_signal2weights(self, s):
         if self.signal2weights is None:
             return s
-        w = self.signal2weights(s[:, self.signal_index:self.signal_index + self.signal_channels])[:, :self.target_params]
+        s = s[:, self.signal_index:self.signal_index + self.signal_channels]
+        groups = self.signal2weights.groups
+        if groups == 1:
+            w = self.signal2weights(s)
+        else:
+            # Compute the grouped 1x1 convolution as a single batched matrix multiplication over the groups
+            b, _, sh, sw = s.shape
+            weight = self.signal2weights.weight.view(groups, -1, self.signal_channels // groups)
+            w = torch.matmul(weight, s.reshape(b, groups, -1, sh * sw)).view(b, -1, sh, sw)
 
-        return w
+        return w[:, :self.target_params]
 
     def forward(self, s):
         return self.apply_signal2weights(s)
 
 
+@torch.jit.script
+def batch_norm_relu6(x, running_mean, running_var, weight, bias, eps: float):
+    """ Evaluation mode batch normalization followed by ReLU6, fused into a single elementwise pass. """
+    scale = weight * torch.rsqrt(running_var + eps)
+    shift = bias - running_mean * scale
+
+    return torch.clamp(x * scale.view(1, -1, 1, 1) + shift.view(1, -1, 1, 1), 0., 6.)
+
+
 class HyperPatchInvertedResidual(nn.Module):
+    in_nc: int
+    out_nc: int
+    hidden_dim: int
+    kernel_size: Tuple[int, int]
+    padding: Tuple[int, int]
+    _padding_repeated_twice: Tuple[int, int, int, int]
+    _ranges: List[int]
+    _split_sizes: List[int]
+    _weight_shapes: List[List[int]]
+
     def __init__(self, in_nc, out_nc, kernel_size=3, stride=1, expand_ratio=1, norm_layer=nn.BatchNorm2d,
                  act_layer=nn.ReLU6(inplace=True), padding_mode='reflect'):
         super(HyperPatchInvertedResidual, self).__init__()
@@ -334,51 +472,88 @@ class HyperPatchInvertedResidual(nn.Module):
         self._ranges = [0]
         self.hyper_params += in_nc * self.hidden_dim
         self._ranges.append(self.hyper_params)
-        self.hyper_params += np.prod((self.hidden_dim,) + self.kernel_size)
+        self.hyper_params += self.hidden_dim * self.kernel_size[0] * self.kernel_size[1]
         self._ranges.append(self.hyper_params)
         self.hyper_params += self.hidden_dim * out_nc
         self._ranges.append(self.hyper_params)
 
+        # Per patch weight split sizes and shapes of the three convolutions (the depthwise convolution's shape
+        # excludes the output channels)
+        self._split_sizes = [self._ranges[i + 1] - self._ranges[i] for i in range(3)]
+        self._weight_shapes = [[self.hidden_dim, in_nc], [1, self.kernel_size[0], self.kernel_size[1]],
+                               [out_nc, self.hidden_dim]]
+
+    @torch.jit.unused
+    def fused_norm_act(self, x, norm_layer_name: str) -> Optional[torch.Tensor]:
+        """ Evaluation mode BatchNorm followed by ReLU6 in a single pass, or None if the layers can't be fused.
+
+        The decision is made on every call, so the normalization layers may be replaced after construction (e.g. by
+        remove_bn). The method is excluded from scripting, scripted modules always use the unfused layers.
+        """
+        norm_layer = getattr(self, norm_layer_name)
+        if self.training or not isinstance(self.act_layer, nn.ReLU6) or not isinstance(norm_layer, nn.BatchNorm2d) or \
+                not norm_layer.affine or not norm_layer.track_running_stats:
+            return None
+
+        return batch_norm_relu6(x, norm_layer.running_mean, norm_layer.running_var, norm_layer.weight, norm_layer.bias,
+                                norm_layer.eps)
+
+    def norm_act1(self, x):
+        if not torch.jit.is_scripting():
+            out = self.fused_norm_act(x, 'bn1')
+            if out is not None:
+                return out
+
+        return self.act_layer(self.bn1(x))
+
+    def norm_act2(self, x):
+        if not torch.jit.is_scripting():
+            out = self.fused_norm_act(x, 'bn2')
+            if out is not None:
+                return out
+
+        return self.act_layer(self.bn2(x))
+
     def conv(self, x, weight):
         b, c, h, w = x.shape
         # assert b == 1
         fh, fw = weight.shape[-2:]
         ph, pw = x.shape[-2] // fh, x.shape[-1] // fw
         kh, kw = ph + self.padding[0] * 2, pw + self.padding[1] * 2
+        n = b * fh * fw  # Total number of patches
 
-        if self.padding_mode != 'zeros' and np.any(self._padding_repeated_twice):
-            x = F.pad(x, self._padding_repeated_twice, mode=self.padding_mode)
-            padding = _pair(0)
-        else:
-            padding = self.padding
-
-        x = x.permute(0, 2, 3, 1).unfold(1, kh, ph).unfold(2, kw, pw).reshape(1, -1, kh, kw)
-
-        if b == 1:
-            weight = weight.permute(0, 2, 3, 1).view(-1, weight.shape[1])
-        else:
-            weight = weight.permute(0, 2, 3, 1).reshape(-1, weight.shape[1])
-
-        # Conv1
-        weight1 = weight[:, self._ranges[0]:self._ranges[1]].reshape(b * fh * fw * self.hidden_dim, self.in_nc, 1, 1)
-        x = F.conv2d(x, weight1, bias=None, groups=b * fh * fw)
-        x = self.bn1(x.view(b * fh * fw, -1, kh, kw)).view(1, -1, kh, kw)
-        x = self.act_layer(x)
-        # x = self.act_layer(self.bn1(F.conv2d(x, weight1, bias=None, groups=b * fh * fw)))
-
-        # Conv2
-        weight2 = weight[:, self._ranges[1]:self._ranges[2]].reshape(b * fh * fw * self.hidden_dim, 1,
-                                                                     *self.kernel_size)
-        x = F.conv2d(x, weight2, bias=None, stride=self.stride, groups=b * fh * fw * self.hidden_dim)
-        x = self.bn2(x.view(b * fh * fw, -1, ph, pw)).view(1, -1, ph, pw)
-        x = self.act_layer(x)
-
-        # Conv3
-        weight3 = weight[:, self._ranges[2]:self._ranges[3]].reshape(b * fh * fw * self.out_nc, self.hidden_dim, 1, 1)
-        x = F.conv2d(x, weight3, bias=None, groups=b * fh * fw)
-        x = self.bn3(x.view(b * fh * fw, -1, ph, pw))
-
-        x = x.view(b, fh, fw, -1, ph, pw).permute(0, 3, 1, 4, 2, 5).reshape(b, -1, h, w)
+        # Extract the padded patches in a single pass: (B * fh * fw) x C x kh x kw
+        x = F.pad(x, self._padding_repeated_twice, mode=self.padding_mode)
+        x = F.unfold(x, (kh, kw), stride=(ph, pw))  # B x (C x (kh x kw)) x (fh * fw)
+        x = x.transpose(1, 2).reshape(n, c, kh, kw)
+
+        # Split the weights per convolution while they are still B x P x fh x fw planes (a free view), so each part is
+        # transposed to per patch weights with a single copy
+        weight1, weight2, weight3 = torch.split(weight, self._split_sizes, dim=1)
+
+        # The activations are kept as (B * fh * fw) x C x H x W so the channel-wise normalization layers can be applied
+        # directly. The per patch 1x1 convolutions are computed as a single batched matrix multiplication instead of
+        # a convolution with B * fh * fw groups, and the depthwise convolution operates on a free
+        # 1 x (B * fh * fw * C) x H x W view of the same memory
+
+        # Conv1 (pointwise)
+        weight1 = weight1.permute(0, 2, 3, 1).reshape([n] + self._weight_shapes[0])
+        x = torch.bmm(weight1, x.view(n, c, kh * kw))
+        x = self.norm_act1(x.view(n, -1, kh, kw))
+
+        # Conv2 (depthwise)
+        weight2 = weight2.permute(0, 2, 3, 1).reshape([-1] + self._weight_shapes[1])
+        x = F.conv2d(x.view(1, -1, kh, kw), weight2, bias=None, stride=self.stride, groups=n * self.hidden_dim)
+        x = self.norm_act2(x.view(n, -1, ph, pw))
+
+        # Conv3 (pointwise)
+        weight3 = weight3.permute(0, 2, 3, 1).reshape([n] + self._weight_shapes[2])
+        x = torch.bmm(weight3, x.view(n, self.hidden_dim, ph * pw))
+        x = self.bn3(x.view(n, -1, ph, pw))
+
+        # Stitch the patches back together
+        x = x.view(b, fh * fw, -1).transpose(1, 2)  # B x (C x (ph x pw)) x (fh * fw)
+        x = F.fold(x, (h, w), kernel_size=(ph, pw), stride=(ph, pw))
 
         return x
 
@@ -462,7 +637,7 @@ class WeightMapper(nn.Module):
 
 
 def next_multiply(x, base):
-    return type(x)(np.ceil(x / base) * base)
+    return type(x)(-(-x // base) * base)
 
 
 class HyperPatchNoPadding(nn.Module):
@@ -478,7 +653,7 @@ class HyperPatchNoPadding(nn.Module):
         self.stride = _pair(stride)
         self.dilation = _pair(dilation)
         self.groups = groups
-        self.hyper_params = np.prod((out_channels, in_channels // groups) + self.kernel_size)
+        self.hyper_params = out_channels * (in_channels // groups) * self.kernel_size[0] * self.kernel_size[1]
 
     def forward(self, x, weight):
         b, c, h, w = x.shape
@@ -486,7 +661,7 @@ class HyperPatchNoPadding(nn.Module):
         ph, pw = x.shape[-2] // fh, x.shape[-1] // fw
 
         weight = weight.permute(0, 2, 3, 1).reshape(
-            b * fh * fw * self.out_channels, self.in_channels // self.groups, *self.kernel_size)
+            b * fh * fw * self.out_channels, self.in_channels // self.groups, self.kernel_size[0], self.kernel_size[1])
         x = x.view(b, c, fh, ph, fw, pw).permute(0, 2, 4, 1, 3, 5).reshape(1, -1, ph, pw)
         x = F.conv2d(x, weight, bias=None, stride=self.stride, dilation=self.dilation, groups=b * fh * fw * self.groups)
         x = x.view(b, fh, fw, -1, ph, pw).permute(0, 3, 1, 4, 2, 5).reshape(b, -1, h, w)
@@ -615,13 +790,14 @@ def divide_feature(in_feature, out_features, min_unit=8):
         in_feature must be divisible by this number as well
 
     Returns:
-        np.array: array of integers of the divided input feature in the size of out_features.
+        list of int: list of integers of the divided input feature in the size of out_features.
     """
     assert in_feature % min_unit == 0, f'in_feature ({in_feature}) must be divisible by min_unit ({min_unit})'
     units = in_feature // min_unit
-    indices = np.argsort(out_features)
-    out_features_sorted = np.array(out_features)[indices]
-    out_feat_groups = [(k, indices[list(g)]) for k, g in groupby(range(len(indices)), lambda i: out_features_sorted[i])]
+    indices = sorted(range(len(out_features)), key=out_features.__getitem__)
+    out_features_sorted = [out_features[i] for i in indices]
+    out_feat_groups = [(k, [indices[i] for i in g])
+                       for k, g in groupby(range(len(indices)), lambda i: out_features_sorted[i])]
     out_feat_groups.sort(key=lambda x: x[0] * len(x[1]), reverse=True)
     units_feat_ratio = float(units) / sum(out_features)
 
@@ -643,10 +819,10 @@ def divide_feature(in_feature, out_features, min_unit=8):
             out_group_units[-1] += remaining_units
 
     # Final feature division
-    divided_in_features = np.zeros(len(out_features), dtype=int)
+    divided_in_features = [0] * len(out_features)
     for i, out_feat_group in enumerate(out_feat_groups):
         for j in range(len(out_feat_group[1])):
-            divided_in_features[out_feat_group[1][j]] = out_group_units[i] // len(out_feat_group[1]) * min_unit
+            divided_in_features[out_feat_group[1][j]] = int(out_group_units[i] // len(out_feat_group[1]) * min_unit)
 
     return divided_in_features
 
@@ -661,31 +837,98 @@ def hyperseg_efficientnet(model_name, pretrained=False, out_feat_scale=0.25, lev
     model = HyperGen(backbone, weight_mapper, **kwargs)
 
     if weights_path is not None:
-        checkpoint = torch.load(weights_path)
+        checkpoint = torch.load(weights_path, map_location='cpu', mmap=True)
         state_dict = checkpoint['state_dict']
-        model.load_state_dict(state_dict, strict=True)
+        model.load_state_dict(state_dict, strict=True, assign=True)
 
     return model
 
 
 def main(model='models.hyperseg_v1_0_unify.hyperseg_efficientnet', res=(512,),
          pyramids=None,
-         train=False):
+         train=False, compile_model=False, batch_size=1):
+    import os
     from utils.obj_factory import obj_factory
     from utils.utils import set_device
     from utils.img_utils import create_pyramid
-    from tqdm import tqdm
 
     assert len(res) <= 2, f'res must be either a single number or a pair of numbers: "{res}"'
     res = res * 2 if len(res) == 1 else res
 
-    torch.set_grad_enabled(False)
+    # Let the CUDA caching allocator grow its segments in place instead of issuing many cudaMalloc calls while the
+    # first forward pass builds up the activation pool. This must be set before the first CUDA allocation.
+    if torch.cuda.is_available():
+        os.environ.setdefault('PYTORCH_CUDA_ALLOC_CONF', 'expandable_segments:True')
+
     torch.backends.cudnn.benchmark = True
+    torch.backends.cudnn.deterministic = False
+    torch.backends.cudnn.allow_tf32 = True
+    torch.set_float32_matmul_precision('high')
     device, gpus = set_device()
-    model = obj_factory(model).to(device).train(train)
-    x = torch.rand(1, 3, *res).to(device)
-    x = create_pyramid(x, pyramids) if pyramids is not None else x
-    pred = model(x)
+    amp_dtype = torch.float16 if device.type == 'cuda' else torch.bfloat16
+
+    # The model is created outside inference mode, its parameters must not be inference tensors for torch.compile.
+    # Only the backbone is kept in channels last memory format, the patch-wise decoder doesn't benefit from it
+    model = obj_factory(model, channels_last=True).to(device).train(train)
+
+    # Inference mode skips the autograd view and version counter bookkeeping entirely
+    with torch.enable_grad() if train else torch.inference_mode(), \
+            torch.autocast(device_type=device.type, dtype=amp_dtype, enabled=not train):
+        x = torch.empty(batch_size, 3, *res, device=device).uniform_()
+        x = create_pyramid(x, pyramids) if pyramids is not None else x
+
+        # Compile the model with torch.compile, compilation happens lazily so the warmup is part of the attempt
+        compiled = False
+        if compile_model and not train:
+            try:
+                compiled_model = torch.compile(model, mode='reduce-overhead', dynamic=False)
+                for _ in range(2):
+                    compiled_model(x)
+                model, compiled = compiled_model, True
+            except Exception as e:
+                # A failed compilation may leave the tracing state behind, which breaks a subsequent torch.jit.trace,
+                # so fall back to the eager model instead
+                torch._dynamo.reset()
+                print(f'torch.compile failed, falling back to the eager model: {e}')
+
+        # Compile the model with TorchScript, falling back to tracing if the model's dynamic control flow can't be
+        # scripted
+        if not train and not compile_model:
+            try:
+                model = torch.jit.script(model)
+            except Exception:
+                model = torch.jit.trace(model, (x,))
+
+        # Warmup, so the JIT optimization passes and the cuDNN autotuning complete before the actual forward pass
+        if not compiled:
+            for _ in range(3):
+                model(x)
+            if device.type == 'cuda':
+                torch.cuda.synchronize()
+
+        # The reduce-overhead mode of torch.compile already replays the forward pass from CUDA graphs
+        if device.type == 'cuda' and not train and not compiled:
+            # Capture the forward pass in a CUDA graph, replaying it removes the per kernel launch overhead
+            is_list = isinstance(x, (list, tuple))
+            static_x = [p.clone() for p in x] if is_list else x.clone()
+            stream = torch.cuda.Stream()
+            stream.wait_stream(torch.cuda.current_stream())
+            with torch.cuda.stream(stream):
+                for _ in range(3):
+                    model(static_x)
+            torch.cuda.current_stream().wait_stream(stream)
+            graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(graph):
+                static_pred = model(static_x)
+
+            for sp, p in zip(static_x, x) if is_list else [(static_x, x)]:
+                sp.copy_(p)
+            graph.replay()
+            torch.cuda.synchronize()
+            pred = static_pred
+        else:
+            pred = model(x)
+
     print(pred.shape)
 
 
@@ -701,6 +944,11 @@ if __name__ == "__main__":
                         metavar='N', help='image resolution')
     parser.add_argument('-p', '--pyramids', type=int, metavar='N',
                         help='number of image pyramids')
+    parser.add_argument('-b', '--batch-size', default=1, type=int, metavar='N',
+                        help='mini-batch size')
     parser.add_argument('-t', '--train', action='store_true',
                         help='If True, sets the model to training mode')
+    parser.add_argument('-c', '--compile', dest='compile_model', action='store_true',
+                        help='If True, compiles the model with torch.compile instead of TorchScript (falls back to '
+                             'the eager model if the compilation fails)')
     main(**vars(parser.parse_args()))
@@ -2,7 +2,6 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from torch.nn.modules.utils import _pair
-import numpy as np
 from models.layers.meta_sequential import MetaSequential
 
 
@@ -158,7 +157,8 @@ class MetaConv2d(nn.Module):
         self.groups = groups
         self.padding_mode = padding_mode
         self._padding_repeated_twice = self.padding + self.padding
-        self.hyper_params = np.prod((out_channels, in_channels // groups) + self.kernel_size)
+        self._pad_input = padding_mode != 'zeros' and any(self._padding_repeated_twice)
+        self.hyper_params = out_channels * (in_channels // groups) * self.kernel_size[0] * self.kernel_size[1]
 
     def forward(self, x, w):
         """ Convolution forward pass.
@@ -172,16 +172,17 @@ class MetaConv2d(nn.Module):
         """
         assert x.shape[0] == w.shape[0]
         batch_size = x.shape[0]
-        x = x.view(1, -1, *x.shape[2:])
-        w = w.view(w.shape[0] * self.out_channels, self.in_channels // self.groups, *self.kernel_size)
-        if self.padding_mode != 'zeros' and np.any(self._padding_repeated_twice):
+        x = x.view(1, -1, x.shape[2], x.shape[3])
+        w = w.view(w.shape[0] * self.out_channels, self.in_channels // self.groups, self.kernel_size[0],
+                   self.kernel_size[1])
+        if self._pad_input:
             x = F.pad(x, self._padding_repeated_twice, mode=self.padding_mode)
-            padding = _pair(0)
+            padding = (0, 0)
         else:
             padding = self.padding
         x = F.conv2d(x, w, bias=None, stride=self.stride, dilation=self.dilation, padding=padding,
                      groups=batch_size * self.groups)
-        x = x.view(batch_size, -1, *x.shape[2:])
+        x = x.view(batch_size, -1, x.shape[2], x.shape[3])
 
         return x
 
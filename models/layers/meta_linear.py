@@ -95,7 +95,7 @@ def main(model='models.layers.meta_linear.MetaLinear', in_features=3, out_featur
     device, gpus = set_device()
     model = obj_factory(model, in_features=in_features, out_features=out_features).to(device)
     print(model)
-    x = torch.rand(2, in_features).to(device)
+    x = torch.empty(2, in_features, device=device).uniform_()
     w = torch.ones(2, out_features * in_features).to(device)
     out = model(x, w)
     print(out.shape)
@@ -270,7 +270,7 @@ def main(model='models.layers.meta_conv.MetaConv2d(kernel_size=3)', in_channels=
     model = obj_factory(model, in_channels=in_channels, out_channels=out_channels).to(device)
     patch_model = MetaPatch(model, padding=padding)
 
-    x = torch.rand(2, in_channels, 256, 256).to(device)
+    x = torch.empty(2, in_channels, 256, 256, device=device).uniform_()
     w = torch.ones(2, model.hyper_params, 8, 8).to(device)
     out = patch_model(x, w)
     print(out.shape)
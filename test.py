@@ -18,7 +18,6 @@ from datasets.seg_transforms import Compose
 from utils.utils import set_device, load_model
 from utils.obj_factory import obj_factory
 from utils.seg_utils import blend_seg, ConfusionMatrix
-from utils.utils import remove_data_parallel_from_state_dict
 from utils.img_utils import make_grid, tensor2rgb
 
 
@@ -64,43 +63,6 @@ data.add_argument('-tt', '--tensor_transforms', nargs='+', help='tensor transfor
 d = parser.get_default
 
 
-def load_model(model_path, name='', device=None, arch=None, return_checkpoint=False, train=False):
-    """ Load a model from checkpoint.
-
-    This is a utility function that combines the model weights and architecture (string representation) to easily
-    load any model without explicit knowledge of its class.
-
-    Args:
-        model_path (str): Path to the model's checkpoint (.pth)
-        name (str): The name of the model (for printing and error management)
-        device (torch.device): The device to load the model to
-        arch (str): The model's architecture (string representation)
-        return_checkpoint (bool): If True, the checkpoint will be returned as well
-        train (bool): If True, the model will be set to train mode, else it will be set to test mode
-
-    Returns:
-        (nn.Module, dict (optional)): A tuple that contains:
-            - model (nn.Module): The loaded model
-            - checkpoint (dict, optional): The model's checkpoint (only if return_checkpoint is True)
-    """
-    assert model_path is not None, '%s model must be specified!' % name
-    assert os.path.exists(model_path), 'Couldn\'t find %s model in path: %s' % (name, model_path)
-    print('=> Loading %s model: "%s"...' % (name, os.path.basename(model_path)))
-    checkpoint = torch.load(model_path)
-    assert arch is not None or 'arch' in checkpoint, 'Couldn\'t determine %s model architecture!' % name
-    arch = checkpoint['arch'] if arch is None else arch
-    model = obj_factory(arch)
-    if device is not None:
-        model.to(device)
-    model.load_state_dict(remove_data_parallel_from_state_dict(checkpoint['state_dict']))
-    model.train(train)
-
-    if return_checkpoint:
-        return model, checkpoint
-    else:
-        return model
-
-
 def main(
         # General arguments
         exp_dir, model=d('model'), gpus=d('gpus'), cpu_only=d('cpu_only'), workers=d('workers'),
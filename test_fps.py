@@ -18,7 +18,6 @@ from datasets.seg_transforms import Compose
 from utils.utils import set_device, load_model
 from utils.obj_factory import obj_factory
 from utils.seg_utils import blend_seg, ConfusionMatrix
-from utils.utils import remove_data_parallel_from_state_dict
 from utils.img_utils import make_grid, tensor2rgb
 
 
@@ -48,6 +47,9 @@ general.add_argument('-f', '--forced', action='store_true',
                      help='force the execution of the test loop even when cache file exists')
 general.add_argument('-t', '--trace', action='store_true',
                      help='enables JIT model tracing')
+general.add_argument('-cm', '--compile_mode', metavar='STR',
+                     help='if specified, compiles the model with torch.compile in the given mode '
+                          '(e.g. reduce-overhead)')
 general.add_argument('-i', '--iterations', type=int, metavar='N',
                      help='number of iterations to run the speed test (for both warmup and actual test)')
 
@@ -62,48 +64,12 @@ data.add_argument('-tt', '--tensor_transforms', nargs='+', help='tensor transfor
 d = parser.get_default
 
 
-def load_model(model_path, name='', device=None, arch=None, return_checkpoint=False, train=False):
-    """ Load a model from checkpoint.
-
-    This is a utility function that combines the model weights and architecture (string representation) to easily
-    load any model without explicit knowledge of its class.
-
-    Args:
-        model_path (str): Path to the model's checkpoint (.pth)
-        name (str): The name of the model (for printing and error management)
-        device (torch.device): The device to load the model to
-        arch (str): The model's architecture (string representation)
-        return_checkpoint (bool): If True, the checkpoint will be returned as well
-        train (bool): If True, the model will be set to train mode, else it will be set to test mode
-
-    Returns:
-        (nn.Module, dict (optional)): A tuple that contains:
-            - model (nn.Module): The loaded model
-            - checkpoint (dict, optional): The model's checkpoint (only if return_checkpoint is True)
-    """
-    assert model_path is not None, '%s model must be specified!' % name
-    assert os.path.exists(model_path), 'Couldn\'t find %s model in path: %s' % (name, model_path)
-    print('=> Loading %s model: "%s"...' % (name, os.path.basename(model_path)))
-    checkpoint = torch.load(model_path)
-    assert arch is not None or 'arch' in checkpoint, 'Couldn\'t determine %s model architecture!' % name
-    arch = checkpoint['arch'] if arch is None else arch
-    model = obj_factory(arch)
-    if device is not None:
-        model.to(device)
-    model.load_state_dict(remove_data_parallel_from_state_dict(checkpoint['state_dict']))
-    model.train(train)
-
-    if return_checkpoint:
-        return model, checkpoint
-    else:
-        return model
-
-
 def main(
     # General arguments
     exp_dir, model=d('model'), gpus=d('gpus'), cpu_only=d('cpu_only'), workers=d('workers'), batch_size=d('batch_size'),
     arch=d('arch'), display_worst=d('display_worst'), display_best=d('display_best'),
-    display_sources=d('display_sources'), forced=d('forced'), trace=d('trace'), iterations=d('iterations'),
+    display_sources=d('display_sources'), forced=d('forced'), trace=d('trace'), compile_mode=d('compile_mode'),
+    iterations=d('iterations'),
 
     # Data arguments
     test_dataset=d('test_dataset'), img_transforms=d('img_transforms'), tensor_transforms=d('tensor_transforms')
@@ -151,6 +117,18 @@ def main(
         sample, target = test_dataset[0]
         model = torch.jit.trace(model, sample.unsqueeze(0).to(device))
 
+    # Compile model, specialized for the fixed test resolution (the first test pass serves as warmup). Compilation
+    # happens lazily, so run a first sample to check it succeeds and fall back to the eager model otherwise
+    if compile_mode is not None:
+        sample, target = test_dataset[0]
+        compiled_model = torch.compile(model, mode=compile_mode, dynamic=False)
+        try:
+            compiled_model(sample.unsqueeze(0).to(device))
+            model = compiled_model
+        except Exception as e:
+            torch._dynamo.reset()
+            print(f'torch.compile failed, falling back to the eager model: {e}')
+
     # Support multiple GPUs
     if gpus and len(gpus) > 1:
         model = nn.DataParallel(model, gpus)
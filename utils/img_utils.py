@@ -110,6 +110,9 @@ def make_grid(*args, cols=8, normalize=True, **kwargs):
 def create_pyramid(img, n=1):
     """ Create an image pyramid.
 
+    Each level is downsampled from the previous level rather than from the full resolution image, so every level
+    costs a single pooling kernel over an input that is 4 times smaller than the one before.
+
     Args:
         img (torch.Tensor): An image tensor of shape (B, C, H, W)
         n (int): The number of pyramids to create
@@ -120,9 +123,12 @@ def create_pyramid(img, n=1):
     # If input is a list or tuple return it as it is (probably already a pyramid)
     if isinstance(img, (list, tuple)):
         return img
+    if n <= 1:
+        return [img]
 
     pyd = [img]
-    for i in range(n - 1):
-        pyd.append(nn.functional.avg_pool2d(pyd[-1], 3, stride=2, padding=1, count_include_pad=False))
+    for _ in range(n - 1):
+        img = nn.functional.avg_pool2d(img, 3, stride=2, padding=1, count_include_pad=False)
+        pyd.append(img)
 
     return pyd
@@ -194,7 +194,7 @@ def main(model, res=(512,), pyramids=None, up_pyramid=False, max_depth=None):
     device, gpus = set_device()
     model = obj_factory(model).to(device)
 
-    x = torch.rand(1, 3, *res).to(device)
+    x = torch.empty(1, 3, *res, device=device).uniform_()
     x = create_pyramid(x, pyramids) if pyramids is not None else x
     if up_pyramid:
         x.append(F.interpolate(x[0], scale_factor=2, mode='bilinear', align_corners=False))    # Upsample x2
@@ -1,6 +1,6 @@
 import os
 import importlib
-from functools import partial
+from functools import partial, lru_cache
 
 
 KNOWN_MODULES = {
@@ -36,6 +36,29 @@ def is_str_module(obj_exp):
     return isinstance(obj_exp, str) and '.' in obj_exp or ('(' in obj_exp and ')' in obj_exp)
 
 
+@lru_cache(maxsize=64)
+def get_class(obj_exp):
+    """ Returns the class or function specified by an object string expression without arguments.
+
+    The result is cached, so the module import and attribute lookup are only done once per expression.
+
+    Args:
+        obj_exp (str): The object string expression, e.g. "models.efficientnet.efficientnet"
+
+    Returns:
+        type or function: The class or function the expression refers to
+    """
+    # From here we can assume that dots in the remaining of the expression
+    # only separate between modules and classes
+    module_name, class_name = os.path.splitext(obj_exp)
+    class_name = class_name[1:]
+    if module_name.startswith('hyperseg.'):
+        module_name = module_name[len("hyperseg."):]
+    module = importlib.import_module(KNOWN_MODULES[module_name] if module_name in KNOWN_MODULES else module_name)
+
+    return getattr(module, class_name)
+
+
 def obj_factory(obj_exp, *args, **kwargs):
     """ Creates objects from strings or partial objects with additional provided arguments.
 
@@ -73,14 +96,7 @@ def obj_factory(obj_exp, *args, **kwargs):
 
         obj_exp = obj_exp[:obj_exp.find('(')]
 
-    # From here we can assume that dots in the remaining of the expression
-    # only separate between modules and classes
-    module_name, class_name = os.path.splitext(obj_exp)
-    class_name = class_name[1:]
-    if module_name.startswith('hyperseg.'):
-        module_name = module_name[len("hyperseg."):]
-    module = importlib.import_module(KNOWN_MODULES[module_name] if module_name in KNOWN_MODULES else module_name)
-    module_class = getattr(module, class_name)
+    module_class = get_class(obj_exp)
     class_instance = module_class(*args, **kwargs)
 
     return class_instance
@@ -119,12 +135,7 @@ def partial_obj_factory(obj_exp, *args, **kwargs):
 
         obj_exp = obj_exp[:obj_exp.find('(')]
 
-    # From here we can assume that dots in the remaining of the expression
-    # only separate between modules and classes
-    module_name, class_name = os.path.splitext(obj_exp)
-    class_name = class_name[1:]
-    module = importlib.import_module(KNOWN_MODULES[module_name] if module_name in KNOWN_MODULES else module_name)
-    module_class = getattr(module, class_name)
+    module_class = get_class(obj_exp)
 
     return partial(module_class, *args, **kwargs)
 
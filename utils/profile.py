@@ -563,7 +563,7 @@ def main(model, res=(512,), pyramids=None, max_depth=None):
     device, gpus = set_device()
     model = obj_factory(model).to(device)
 
-    x = torch.rand(1, 3, *res).to(device)
+    x = torch.empty(1, 3, *res, device=device).uniform_()
     x = create_pyramid(x, pyramids) if pyramids is not None else x
 
     # Run profile
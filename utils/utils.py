@@ -144,7 +144,7 @@ def get_arch(obj, *args, eval_partial=True, **kwargs):
     return arch
 
 
-def load_model(model_path, name='', device=None, arch=None, return_checkpoint=False, train=False):
+def load_model(model_path, name='', device=None, arch=None, return_checkpoint=False, train=False, dtype=None):
     """ Load a model from checkpoint.
 
     This is a utility function that combines the model weights and architecture (string representation) to easily
@@ -157,6 +157,8 @@ def load_model(model_path, name='', device=None, arch=None, return_checkpoint=Fa
         arch (str): The model's architecture (string representation)
         return_checkpoint (bool): If True, the checkpoint will be returned as well
         train (bool): If True, the model will be set to train mode, else it will be set to test mode
+        dtype (torch.dtype, optional): If specified, the floating point tensors of the checkpoint will be cast to
+            this type before they are loaded, e.g. torch.float16 for half precision inference
 
     Returns:
         (nn.Module, dict (optional)): A tuple that contains:
@@ -166,13 +168,17 @@ def load_model(model_path, name='', device=None, arch=None, return_checkpoint=Fa
     assert model_path is not None, '%s model must be specified!' % name
     assert os.path.exists(model_path), 'Couldn\'t find %s model in path: %s' % (name, model_path)
     print('=> Loading %s model: "%s"...' % (name, os.path.basename(model_path)))
-    checkpoint = torch.load(model_path)
+    # Load the tensors directly to the target device, the memory mapped file avoids a full copy in CPU memory
+    checkpoint = torch.load(model_path, map_location=device if device is not None else 'cpu', mmap=True)
     assert arch is not None or 'arch' in checkpoint, 'Couldn\'t determine %s model architecture!' % name
     arch = checkpoint['arch'] if arch is None else arch
     model = obj_factory(arch)
     if device is not None:
         model.to(device)
-    model.load_state_dict(checkpoint['state_dict'])
+    state_dict = remove_data_parallel_from_state_dict(checkpoint['state_dict'])  # Support nn.DataParallel checkpoints
+    if dtype is not None:
+        state_dict = {k: v.to(dtype) if v.is_floating_point() else v for k, v in state_dict.items()}
+    model.load_state_dict(state_dict, assign=True)
     model.train(train)
 
     if return_checkpoint: